@@ -8,18 +8,25 @@ import time
 import uuid
 import sys
 import platform
-import base64
+import queue
+import binascii
 import threading
 import datetime
 import functools
 import logging
 
 import tornado
-import anyconfig
+import tornado.web
 from webthing import Property, Thing, Value, WebThingServer
 import picamera
+import picamera.mmalobj
 import Adafruit_PureIO.smbus as smbus
 
+try:
+    import tomllib
+except ImportError:
+    import tomli as tomllib
+
 print = functools.partial(print, flush = True)
 
 logging.basicConfig(level = logging.INFO)
@@ -31,11 +38,86 @@ DEFAULT_CONFIG = os.path.join(SCRIPT_DIR, "defaults.toml")
 CONFIG_DIR = "/var/lib/picamera-webthing"
 USER_CONFIG = os.path.join(CONFIG_DIR, "config.toml")
 
+
+def merge_config(conf, user_conf):
+    """
+        Merges the user config into the defaults, recursing into tables so
+        the user config only needs the settings that differ from the defaults
+    """
+    for key, value in user_conf.items():
+        if isinstance(value, dict) and isinstance(conf.get(key), dict):
+            merge_config(conf[key], value)
+        else:
+            conf[key] = value
+    return conf
+
+
+def load_config():
+    with open(DEFAULT_CONFIG, 'rb') as f:
+        conf = tomllib.load(f)
+
+    try:
+        with open(USER_CONFIG, 'rb') as f:
+            merge_config(conf, tomllib.load(f))
+    except FileNotFoundError:
+        pass
+
+    return conf
+
+
+class FrameBuffer:
+    """
+        A file-like object for picamera to write frames into, which keeps its
+        memory from one frame to the next. A reused io.BytesIO frees its buffer
+        when truncated, so it would be reallocated and regrown for every frame
+    """
+
+    def __init__(self, size):
+        self.buffer = bytearray(size)
+        self.length = 0
+
+    def write(self, data):
+        end = self.length + len(data)
+        if end > len(self.buffer):
+            self.buffer.extend(bytes(end - len(self.buffer)))
+        self.buffer[self.length:end] = data
+        self.length = end
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def truncate(self):
+        self.length = 0
+
+    def getvalue(self):
+        return bytes(memoryview(self.buffer)[:self.length])
+
+
+class StillImageHandler(tornado.web.RequestHandler):
+    """
+        Serves the latest captured JPEG as-is, used instead of the base64
+        encoded stillImage property when `still_image_url` is enabled
+    """
+
+    def initialize(self, camera):
+        self.camera = camera
+
+    def get(self):
+        jpeg = self.camera.get_latest_image()
+        if jpeg is None:
+            raise tornado.web.HTTPError(503)
+
+        self.set_header('Content-Type', 'image/jpeg')
+        self.set_header('Cache-Control', 'no-cache')
+        self.write(jpeg)
+
+
 class PiCameraWebThing:
     """A Web Thing enabled raspberry pi camera"""
 
     def __init__(self):
-        self.conf = anyconfig.load([DEFAULT_CONFIG, USER_CONFIG], ignore_missing = True, ac_merge = anyconfig.MS_REPLACE)
+        self.conf = load_config()
         self.ioloop = tornado.ioloop.IOLoop.current()
 
         self.device_name = self.conf['name']
@@ -45,6 +127,7 @@ class PiCameraWebThing:
         self.sensors_update_interval = self.conf['sensors']['update_interval']
 
         self.use_video_port = self.conf['camera']['use_video_port']
+        self.still_image_url = self.conf['camera']['still_image_url']
         self.framerate = self.conf['camera']['framerate']
         self.iso = self.conf['camera']['iso']
         self.rotation = self.conf['camera']['rotation']
@@ -65,6 +148,17 @@ class PiCameraWebThing:
         self.temperature_value = Value(0.0)
         self.humidity_value = Value(0.0)
 
+        """
+            Camera property values by property name, for pushing updates in
+            batches with apply_updates()
+        """
+        self.camera_values = {
+            'resolution': self.resolution_value,
+            'framerate': self.framerate_value,
+            'exposureMode': self.exposure_mode_value,
+            'stillImage': self.base64_still_image_value,
+        }
+
         self.resolution_property = None
         self.framerate_property = None
         self.exposure_mode_property = None
@@ -72,6 +166,12 @@ class PiCameraWebThing:
         self.temperature_property = None
         self.humidity_property = None
 
+        """
+            Set once the camera is being closed, the camera and notify loops
+            check it once per iteration and exit
+        """
+        self.shutting_down = False
+
         logger.info('Starting PiCamera Web Thing: %s', self.device_name)
 
         self.sensor_setup()
@@ -85,31 +185,61 @@ class PiCameraWebThing:
         self.server.stop()
 
     def cleanup(self):
-        self.camera.stop_preview()
-        self.camera.close()
+        self.camera_properties_callback.stop()
+        if self.sensor_callback is not None:
+            self.sensor_callback.stop()
+
+        with self.camera_lock:
+            self.shutting_down = True
+            self.stop_continuous_capture()
+            self.camera.stop_preview()
+            self.camera.close()
+
+        if self.i2c_bus is not None:
+            self.i2c_bus.close()
+            self.i2c_bus = None
 
     def camera_setup(self):
         """
             Starts a background thread for handling camera captures
         """
-        self.camera = picamera.PiCamera()
+
+        """
+            We set the framerate to 30.0 at startup so the firmware has at
+            least 90 frames (30 * 3 seconds) to use for calibrating the sensor,
+            which is critical in low light. May need to do this periodically
+            as well; if the framerate is set very low the camera will take
+            several minutes or longer to react to lighting changes
+
+            Resolution, framerate and sensor mode are passed to the constructor
+            so they are applied when the camera is opened, rather than each
+            reconfiguring the camera again afterwards
+        """
+        self.camera = picamera.PiCamera(resolution = self.resolution, framerate = 30.0, sensor_mode = self.sensor_mode)
         self.camera_lock = threading.Lock()
 
+        """
+            Settings changed through the Thing are queued here and applied by
+            the camera loop between frames, the event wakes the loop up early
+            when it is waiting for the next frame
+        """
+        self.pending_settings = {}
+        self.settings_lock = threading.Lock()
+        self.settings_event = threading.Event()
+
         with self.camera_lock:
-            self.camera.resolution = self.resolution
+            self.cache_resolution()
             self.camera.rotation = self.rotation
             self.camera.iso = self.iso
-            """
-                We set the framerate to 30.0 at startup so the firmware has at
-                least 90 frames (30 * 3 seconds) to use for calibrating the sensor,
-                which is critical in low light. May need to do this periodically
-                as well; if the framerate is set very low the camera will take
-                several minutes or longer to react to lighting changes
-            """
-            self.camera.framerate = 30.0
             self.camera.shutter_speed = self.shutter_speed
-            self.camera.sensor_mode = self.sensor_mode
             self.camera.exposure_mode = self.exposure_mode
+            """
+                picamera tags every JPEG with the camera make and model in
+                addition to the timestamps, nothing reads them from a live image
+                so skip the extra MMAL parameter calls on each capture. Thumbnails
+                are disabled per capture with `thumbnail = None`
+            """
+            self.camera.exif_tags.clear()
             # may not be necessary, night mode seems to do it automatically
             #self.camera.framerate_range = (0.1, self.framerate)
             self.camera.start_preview()
@@ -127,22 +257,54 @@ class PiCameraWebThing:
                 now set the framerate back to the configured value
             """
             self.camera.framerate = self.framerate
+            self.cache_framerate(self.framerate)
+
+        """
+            The camera loop captures every frame into the same preallocated
+            buffer through picamera's capture_continuous() generator
+        """
+        with self.camera_lock:
+            self.frame_buffer = FrameBuffer(self.frame_buffer_size())
+        self.continuous_capture = None
+
+        """
+            Holds at most one captured image, the camera loop replaces it if the
+            notify loop hasn't picked it up yet
+        """
+        self.frame_queue = queue.Queue(maxsize = 1)
+
+        """
+            The latest image served by StillImageHandler, along with a sequence
+            number so each new image gets a new URL
+        """
+        self.latest_image = None
+        self.latest_image_seq = 0
+        self.latest_image_lock = threading.Lock()
 
         self.camera_thread = threading.Thread(target = self.camera_loop)
         self.camera_thread.daemon = True
         self.camera_thread.start()
 
+        self.notify_thread = threading.Thread(target = self.notify_loop)
+        self.notify_thread.daemon = True
+        self.notify_thread.start()
+
+        self.camera_properties_callback = tornado.ioloop.PeriodicCallback(self.update_camera_properties, 1000)
+        self.camera_properties_callback.start()
+
 
 
     def get_still_image(self):
         """
-            This uses base64 for the image data so the gateway doesn't have to do
-            anything but pass it to the `img` tag using the well known inline syntax
+            Captures a single image on demand, the camera loop does not use this.
+            Any continuous capture in progress is stopped first, the camera loop
+            restarts it afterwards
         """
         _image_stream = io.BytesIO()
         logger.debug("Capturing image <use_video_port:%s>", self.use_video_port)
 
         with self.camera_lock:
+            self.stop_continuous_capture()
             # image quality higher than 10 tends to make large images with no
             # meaningful quality improvement.
             cap_start = time.time()
@@ -150,12 +312,48 @@ class PiCameraWebThing:
             cap_end = time.time()
             logger.debug("Capture took %f seconds", (cap_end - cap_start))
 
-        _image_stream.seek(0)
-        image = base64.b64encode(_image_stream.getvalue())
+        with _image_stream.getbuffer() as jpeg:
+            image = self.encode_image(jpeg)
         _image_stream.close()
         return image
 
 
+    def encode_image(self, jpeg):
+        """
+            This uses base64 for the image data so the gateway doesn't have to do
+            anything but pass it to the `img` tag using the well known inline syntax
+
+            The JPEG is already encoded by the camera firmware, this accepts any
+            bytes-like object so a stream's buffer can be encoded directly.
+            binascii is what the base64 module calls internally anyway, and
+            skips its argument checks and the trailing newline
+        """
+        image = binascii.b2a_base64(jpeg, newline = False)
+        return image
+
+
+    def frame_buffer_size(self):
+        """
+            Comfortably enough for a quality 10 JPEG at the current resolution,
+            the buffer grows if a frame turns out larger. Must be called with the
+            camera lock held
+        """
+        _width, _height = self.camera.resolution
+        return _width * _height // 8
+
+
+    def stop_continuous_capture(self):
+        """
+            picamera refuses to change some settings while an encoder is active,
+            closing the generator releases it and the camera loop starts a new
+            one with the current settings. Must be called with the camera lock
+            held
+        """
+        if self.continuous_capture is not None:
+            self.continuous_capture.close()
+            self.continuous_capture = None
+
+
     def get_resolution(self):
         """
             This formats the resolution as WxH, which the picamera API will actually
@@ -163,106 +361,289 @@ class PiCameraWebThing:
             quite well as we can pass resolution back and forth all the way up
             to the Gateway interface as-is without any further parsing or
             formatting
+
+            The getters return the last value the camera accepted rather than
+            querying the camera, so they can be called from the ioloop without
+            waiting on the camera lock for the duration of a capture
         """
-        with self.camera_lock:
-            _width, _height = self.camera.resolution
-        resolution = "{}x{}".format(_width, _height)
-        return resolution
+        return self.resolution
 
 
     def set_resolution(self, resolution):
-        with self.camera_lock:
-            try:
-                self.camera.resolution = resolution
-                self.resolution = resolution
-                return True
-            except Exception as e:
-                logger.exception("Failed to set resolution")
-                return False
+        """
+            Validated with the same parsing picamera uses when the resolution is
+            applied, so named resolutions like "VGA" or "720p" are accepted too
+        """
+        try:
+            picamera.mmalobj.to_resolution(resolution)
+        except Exception as e:
+            logger.exception("Invalid resolution")
+            return False
+
+        self.queue_setting('resolution', resolution)
+        return True
+
+
+    def cache_resolution(self):
+        """
+            Formats the resolution the camera actually accepted once, rather
+            than every time it is read. Must be called with the camera lock held
+        """
+        _width, _height = self.camera.resolution
+        self.resolution = f"{_width}x{_height}"
 
 
     def get_framerate(self):
-        with self.camera_lock:
-            _fr = float(self.camera.framerate)
-        framerate = "{}".format(_fr)
-        return framerate
+        return self.framerate_str
 
 
     def set_framerate(self, framerate):
-        with self.camera_lock:
-            try:
-                self.camera.framerate = framerate
-                self.framerate = framerate
-                return True
-            except Exception as e:
-                logger.exception("Failed to set framerate")
-                return False
+        try:
+            if float(framerate) < 0:
+                raise ValueError("Framerate must not be negative")
+        except Exception as e:
+            logger.exception("Invalid framerate")
+            return False
+
+        self.queue_setting('framerate', framerate)
+        return True
+
+
+    def cache_framerate(self, framerate):
+        """
+            Keeps the framerate as a float along with the matching capture
+            interval, so the camera loop doesn't parse the string sent by the
+            Gateway on every frame. A framerate of 0 lets the camera capture as
+            fast as it can
+        """
+        self.framerate = float(framerate)
+        self.framerate_str = f"{self.framerate}"
+        self.wait_interval = 1.0 / self.framerate if self.framerate > 0 else 0.0
 
 
     def get_exposure_mode(self):
-        with self.camera_lock:
-            _ex = self.camera.exposure_mode
+        _ex = self.exposure_mode
         return _ex
 
 
     def set_exposure_mode(self, exposure_mode):
-        with self.camera_lock:
-            try:
-                self.camera.exposure_mode = exposure_mode
-                self.exposure_mode = exposure_mode
+        if exposure_mode not in picamera.PiCamera.EXPOSURE_MODES:
+            logger.error("Invalid exposure mode: %s", exposure_mode)
+            return False
 
-                return True
-            except Exception as e:
-                logger.exception("Failed to set exposure mode")
-                return False
+        self.queue_setting('exposure_mode', exposure_mode)
+        return True
+
+
+    def queue_setting(self, name, value):
+        """
+            Changing the resolution or framerate reconfigures the camera, which
+            can take long enough to stall a capture. The setters only validate
+            and queue the value, the camera loop applies it between frames
+        """
+        with self.settings_lock:
+            self.pending_settings[name] = value
+        self.settings_event.set()
+
+
+    def apply_pending_settings(self):
+        """
+            Called by the camera loop between frames
+        """
+        with self.settings_lock:
+            settings = self.pending_settings
+            self.pending_settings = {}
+            self.settings_event.clear()
+
+        with self.camera_lock:
+            if 'resolution' in settings or 'framerate' in settings:
+                self.stop_continuous_capture()
+
+            if 'resolution' in settings:
+                try:
+                    self.camera.resolution = settings['resolution']
+                    self.cache_resolution()
+                    self.frame_buffer = FrameBuffer(self.frame_buffer_size())
+                except Exception as e:
+                    logger.exception("Failed to set resolution")
+
+            if 'framerate' in settings:
+                try:
+                    self.camera.framerate = settings['framerate']
+                    self.cache_framerate(settings['framerate'])
+                except Exception as e:
+                    logger.exception("Failed to set framerate")
+
+            if 'exposure_mode' in settings:
+                try:
+                    self.camera.exposure_mode = settings['exposure_mode']
+                    self.exposure_mode = settings['exposure_mode']
+                except Exception as e:
+                    logger.exception("Failed to set exposure mode")
 
 
     def camera_loop(self):
         """
-            Camera loop
+            Camera loop, only captures images and hands them to the notify loop
+            through the single slot frame queue. If the notify loop hasn't
+            picked up the previous image yet it is discarded, a stale image is
+            of no use to anyone
+
+            Frames are scheduled against a monotonic deadline so the time spent
+            capturing counts toward the frame interval instead of being added
+            to it
 
         """
         logger.info('Camera loop running')
 
-        while True:
-            try:
-                image = self.get_still_image()
-                if self.base64_still_image_value is not None and image is not None:
-                    self.ioloop.add_callback(self.base64_still_image_value.notify_of_external_update,
-                                             image.decode('utf-8'))
-            except Exception as e:
-                logger.exception('Exception occured while updating image property')
+        while not self.shutting_down:
+            with self.camera_lock:
+                # image quality higher than 10 tends to make large images with no
+                # meaningful quality improvement.
+                frame_buffer = self.frame_buffer
+                frame_buffer.truncate()
+                frames = self.camera.capture_continuous(frame_buffer, format = 'jpeg', quality = 10, thumbnail = None, use_video_port = self.use_video_port)
+                self.continuous_capture = frames
 
+            logger.debug("Continuous capture started <use_video_port:%s>", self.use_video_port)
+
+            """
+                The capture is restarted whenever the resolution or framerate
+                changes, so schedule from now rather than from a deadline based
+                on the old framerate
+            """
+            next_deadline = time.monotonic()
+
+            while not self.shutting_down:
+                try:
+                    if self.settings_event.is_set():
+                        self.apply_pending_settings()
+
+                    with self.camera_lock:
+                        cap_start = time.time()
+                        try:
+                            next(frames)
+                        except StopIteration:
+                            """
+                                The generator was closed to change a setting,
+                                or failed on a previous frame, start a new one
+                            """
+                            break
+                        cap_end = time.time()
+                        if logger.isEnabledFor(logging.DEBUG):
+                            logger.debug("Capture took %f seconds", (cap_end - cap_start))
+
+                    """
+                        Base64 encoding happens on the notify loop so the next
+                        capture doesn't wait on it, which needs a copy of the
+                        JPEG as the buffer is reused for the next frame
+                    """
+                    jpeg = frame_buffer.getvalue()
+                    frame_buffer.truncate()
+
+                    self.queue_image(jpeg)
+                except Exception as e:
+                    logger.exception('Exception occured while capturing image')
+
+                wait_time = next_deadline + self.wait_interval - time.monotonic()
+
+                if wait_time > 0:
+                    if logger.isEnabledFor(logging.DEBUG):
+                        logger.debug("Camera sleeping for %.2f (fps: %.2f)", wait_time, self.framerate)
+
+                    """
+                        A queued setting cuts the wait short, the deadline is
+                        only advanced when the full interval actually passed
+                    """
+                    if not self.settings_event.wait(wait_time):
+                        next_deadline += self.wait_interval
+                else:
+                    """
+                        The capture took longer than the frame interval, start
+                        over from now rather than capturing back to back to
+                        catch up on frames nobody will see
+                    """
+                    next_deadline = time.monotonic()
+
+
+    def queue_image(self, jpeg):
+        """
+            Replaces any image the notify loop hasn't picked up yet, so an image
+            that would be stale by the time it was encoded is never encoded
+        """
+        try:
+            self.frame_queue.put_nowait(jpeg)
+        except queue.Full:
             try:
-                resolution = self.get_resolution()
-                if self.resolution_value is not None and resolution is not None:
-                    self.ioloop.add_callback(self.resolution_value.notify_of_external_update,
-                                             resolution)
-            except Exception as e:
-                logger.exception('Exception occured while updating resolution property')
+                self.frame_queue.get_nowait()
+            except queue.Empty:
+                pass
+            self.frame_queue.put_nowait(jpeg)
 
 
-            try:
-                framerate = self.get_framerate()
-                if self.framerate_value is not None and framerate is not None:
-                    self.ioloop.add_callback(self.framerate_value.notify_of_external_update,
-                                             framerate)
-            except Exception as e:
-                logger.exception('Exception occured while updating framerate property')
+    def notify_loop(self):
+        """
+            Notify loop, pushes the latest captured image to the Thing, either
+            base64 encoded or as a URL to the raw JPEG when `still_image_url` is
+            enabled, which skips encoding entirely and sends a third less data
 
+        """
+        logger.info('Notify loop running')
 
+        while not self.shutting_down:
+            """
+                Time out now and then so the loop notices shutting_down even
+                when no more images arrive
+            """
             try:
-                exposure_mode = self.get_exposure_mode()
-                if self.exposure_mode_value is not None and exposure_mode is not None:
-                    self.ioloop.add_callback(self.exposure_mode_value.notify_of_external_update,
-                                             exposure_mode)
+                jpeg = self.frame_queue.get(timeout = 1)
+            except queue.Empty:
+                continue
+
+            try:
+                if self.still_image_url:
+                    with self.latest_image_lock:
+                        self.latest_image = jpeg
+                        self.latest_image_seq += 1
+                        image = "/stillImage.jpg?seq={}".format(self.latest_image_seq)
+                else:
+                    image = self.encode_image(jpeg).decode('ascii')
+
+                self.ioloop.add_callback(self.apply_updates, {'stillImage': image})
             except Exception as e:
-                logger.exception('Exception occured while updating exposure_mode property')
+                logger.exception('Exception occured while updating image property')
+
+
+    def get_latest_image(self):
+        with self.latest_image_lock:
+            return self.latest_image
+
 
-            wait_interval = 1.0 / float(self.framerate)
-            logger.debug("Camera sleeping for %.2f (fps: %.2f)", wait_interval, float(self.framerate))
+    def update_camera_properties(self):
+        """
+            Runs on the ioloop once per second rather than with every frame,
+            these settings rarely change
+
+        """
+        self.apply_updates({
+            'resolution': self.get_resolution(),
+            'framerate': self.get_framerate(),
+            'exposureMode': self.get_exposure_mode(),
+        })
 
-            time.sleep(wait_interval)
+
+    def apply_updates(self, updates):
+        """
+            Pushes a batch of camera property values to the Thing, must run on
+            the ioloop. Value ignores an update that matches the last value it
+            sent, so unchanged settings don't go out to clients again
+
+        """
+        for name, value in updates.items():
+            try:
+                self.camera_values[name].notify_of_external_update(value)
+            except Exception as e:
+                logger.exception('Exception occured while updating %s property', name)
 
 
     def webthing_setup(self):
@@ -307,7 +688,7 @@ class PiCameraWebThing:
                                                     'stillImage',
                                                     metadata = {
                                                         'type': 'stillImage',
-                                                        'unit': 'base64',
+                                                        'unit': 'url' if self.still_image_url else 'base64',
                                                         'friendlyName': 'Image',
                                                         'description': 'A still image from the camera',
                                                     },
@@ -355,49 +736,95 @@ class PiCameraWebThing:
                                               value = self.humidity_value)
             self.thing.add_property(self.humidity_property)
 
-        self.server = WebThingServer([self.thing], port = self.port)
+        if self.still_image_url:
+            self.server = WebThingServer([self.thing],
+                                         port = self.port,
+                                         additional_routes = [
+                                             (r'/stillImage\.jpg', StillImageHandler, dict(camera = self)),
+                                         ])
+        else:
+            self.server = WebThingServer([self.thing], port = self.port)
 
 
     def sensor_setup(self):
+        """
+            Sensors are read from the ioloop rather than a dedicated thread.
+            Each reading is split into a request and a read callback, so the
+            ioloop is free while the sensor is busy converting
+        """
+        self.i2c_bus = None
+        self.sensor_callback = None
+
         if self.si7021_enabled:
-            self.sensor_thread = threading.Thread(target = self.sensor_loop)
-            self.sensor_thread.daemon = True
-            self.sensor_thread.start()
+            self.open_i2c_bus()
+
+            self.sensor_callback = tornado.ioloop.PeriodicCallback(self.request_si7021_humidity,
+                                                                   self.sensors_update_interval * 1000)
+            self.sensor_callback.start()
+
+            # PeriodicCallback waits a full interval before the first run, take
+            # the first reading as soon as the ioloop starts
+            self.ioloop.add_callback(self.request_si7021_humidity)
 
-    def get_si7021_values(self):
-        temperature = None
-        humidity = None
+
+    def open_i2c_bus(self):
+        """
+            The bus is kept open between readings rather than opened for each
+            one, and reopened after a bus error in case the handle went bad
+        """
+        if self.i2c_bus is not None:
+            try:
+                self.i2c_bus.close()
+            except Exception as e:
+                pass
+            self.i2c_bus = None
 
         try:
             # Get I2C bus
-            bus = smbus.SMBus(1)
+            self.i2c_bus = smbus.SMBus(1)
+        except Exception as e:
+            logger.exception("Failed to open I2C bus")
+
+
+    def request_si7021_humidity(self):
+        if self.i2c_bus is None:
+            self.open_i2c_bus()
+            if self.i2c_bus is None:
+                return
 
+        try:
             # SI7021 address, 0x40(64)
             #		0xF5(245)	Select Relative Humidity NO HOLD master mode
-            bus.write_byte(0x40, 0xF5)
+            self.i2c_bus.write_byte(0x40, 0xF5)
+        except Exception as e:
+            logger.exception("Failed to request si7021 humidity")
+            self.open_i2c_bus()
+            return
+
+        # humidity conversion (which includes a temperature conversion) takes
+        # at most ~23ms
+        self.ioloop.call_later(0.025, self.read_si7021_values)
 
-            time.sleep(0.3)
 
+    def read_si7021_values(self):
+        bus = self.i2c_bus
+        if bus is None:
+            return
+
+        try:
             # SI7021 address, 0x40(64)
-            # Read data back, 2 bytes, Humidity MSB first
-            data0 = bus.read_byte(0x40)
-            data1 = bus.read_byte(0x40)
+            # Read data back in one transaction, 2 bytes, Humidity MSB first
+            data0, data1 = bus.read_bytes(0x40, 2)
 
             # Convert the data
             humidity = ((data0 * 256 + data1) * 125 / 65536.0) - 6
 
-            time.sleep(0.3)
-
-            # SI7021 address, 0x40(64)
-            #       0xF3(243)   Select temperature NO HOLD master mode
-            bus.write_byte(0x40, 0xF3)
-
-            time.sleep(0.3)
+            self.humidity_value.notify_of_external_update(humidity)
 
             # SI7021 address, 0x40(64)
+            #       0xE0(224)   Read temperature value from the previous RH measurement
             # Read data back, 2 bytes, Temperature MSB first
-            data0 = bus.read_byte(0x40)
-            data1 = bus.read_byte(0x40)
+            data0, data1 = bus.read_i2c_block_data(0x40, 0xE0, 2)
 
             # Convert the data
             temperature = ((data0 * 256 + data1) * 175.72 / 65536.0) - 46.85
@@ -405,39 +832,13 @@ class PiCameraWebThing:
             # Convert celsius to fahrenheit
             temperature = (temperature * 1.8) + 32
 
+            self.temperature_value.notify_of_external_update(temperature)
+        except OSError as e:
+            logger.exception("Failed to get si7021 sensor data")
+            self.open_i2c_bus()
         except Exception as e:
             logger.exception("Failed to get si7021 sensor data")
 
-        return temperature, humidity
-
-
-    def sensor_loop(self):
-        """
-            Sensor loop
-
-        """
-        logger.info('Sensor loop running')
-        while True:
-            try:
-                temperature = None
-                humidity = None
-
-                if self.si7021_enabled:
-                    temperature, humidity = self.get_si7021_values()
-
-                if self.temperature_value is not None and temperature is not None:
-                    self.ioloop.add_callback(self.temperature_value.notify_of_external_update,
-                                             temperature)
-
-                if self.humidity_value is not None and humidity is not None:
-                    self.ioloop.add_callback(self.humidity_value.notify_of_external_update,
-                                             humidity)
-
-            except Exception as e:
-                logger.exception('Exception occured while updating sensor properties')
-
-            time.sleep(self.sensors_update_interval)
-
 
 
 